@@ -24,6 +24,7 @@ class ActivationBuffer:
                  ctx_len=128, # length of each context
                  load_buffer_batch_size=512, # size of batches in which to process the data when adding to buffer
                  return_act_batch_size=8192, # size of batches in which to return activations
+                 pin_memory=False, # if True, activations are stored on the CPU and CUDA is available, return batches in pinned memory
                  device='cpu' # device on which to store the activations
                  ):
         
@@ -44,7 +45,7 @@ class ActivationBuffer:
             self.activations = t.empty(0, submodule_output_dim, device=device)
         else:
             raise ValueError("io must be either 'in' or 'out'")
-        self.read = t.zeros(0).bool()
+        self.read = t.zeros(0, dtype=t.bool, device=device)
 
         self.data = data
         self.model = model
@@ -55,6 +56,8 @@ class ActivationBuffer:
         self.load_buffer_batch_size = load_buffer_batch_size
         self.return_act_batch_size = return_act_batch_size
         self.device = device
+        # pinned batches can be copied to the GPU asynchronously with .to(..., non_blocking=True)
+        self.pin_memory = pin_memory and t.device(device).type == 'cpu' and t.cuda.is_available()
     
     def __iter__(self):
         return self
@@ -65,14 +68,26 @@ class ActivationBuffer:
         """
         with t.no_grad():
             # if buffer is less than half full, refresh
-            if (~self.read).sum() < self.n_ctxs * self.ctx_len // 2:
+            unreads = (~self.read).nonzero().squeeze(1)
+            if len(unreads) < self.n_ctxs * self.ctx_len // 2:
                 self.refresh()
+                unreads = (~self.read).nonzero().squeeze(1)
 
             # return a batch
-            unreads = (~self.read).nonzero().squeeze()
             idxs = unreads[t.randperm(len(unreads), device=unreads.device)[:self.return_act_batch_size]]
             self.read[idxs] = True
+            if self.pin_memory:
+                return self._pinned_batch(idxs)
             return self.activations[idxs]
+
+    def _pinned_batch(self, idxs):
+        """
+        Gather the activations at idxs directly into a new pinned tensor.
+        """
+        # pinned memory comes from torch's caching host allocator, which only hands a block out again once
+        # the tensor is freed and any asynchronous copies from it (on any device or stream) have finished
+        pinned = t.empty(len(idxs), self.activations.shape[1], dtype=self.activations.dtype, pin_memory=True)
+        return t.index_select(self.activations, 0, idxs, out=pinned)
     
     def text_batch(self, batch_size=None):
         """
@@ -101,9 +116,12 @@ class ActivationBuffer:
         )
 
     def refresh(self):
-        self.activations = self.activations[~self.read]
+        # collect new activations in a list and concatenate once at the end, rather than
+        # re-copying the whole buffer on every batch
+        chunks = [self.activations[~self.read]]
+        n_acts = len(chunks[0])
 
-        while len(self.activations) < self.n_ctxs * self.ctx_len:
+        while n_acts < self.n_ctxs * self.ctx_len:
             
             with t.no_grad():
                 with self.model.trace(self.text_batch(), **tracer_kwargs, invoker_args={'truncation': True, 'max_length': self.ctx_len}):
@@ -117,8 +135,11 @@ class ActivationBuffer:
             if isinstance(hidden_states, tuple):
                 hidden_states = hidden_states[0]
             hidden_states = hidden_states[attn_mask != 0]
-            self.activations = t.cat([self.activations, hidden_states.to(self.device)], dim=0)
-            self.read = t.zeros(len(self.activations), dtype=t.bool, device=self.device)
+            chunks.append(hidden_states.to(self.device))
+            n_acts += len(hidden_states)
+
+        self.activations = t.cat(chunks, dim=0)
+        self.read = t.zeros(len(self.activations), dtype=t.bool, device=self.device)
 
     def close(self):
         """
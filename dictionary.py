@@ -45,7 +45,8 @@ class AutoEncoder(Dictionary, nn.Module):
         self.decoder.weight = nn.Parameter(dec_weight)
 
     def encode(self, x):
-        return nn.ReLU()(self.encoder(x - self.bias))
+        # centering happens before the encoder matmul and isn't autocast, so it stays exact in fp32
+        return t.relu(self.encoder(x - self.bias))
     
     def decode(self, f):
         return self.decoder(f) + self.bias
@@ -67,15 +68,33 @@ class AutoEncoder(Dictionary, nn.Module):
         
         else: # ghost mode
             f_pre = self.encoder(x - self.bias)
-            f_ghost = t.exp(f_pre) * ghost_mask.to(f_pre)
-            f = nn.ReLU()(f_pre)
+            # only the ghost features contribute to x_ghost, so gather them instead of masking every feature
+            ghost_idxs = ghost_mask.nonzero().squeeze(1)
+            f_ghost = t.exp(f_pre.index_select(-1, ghost_idxs))
+            f = t.relu(f_pre)
 
-            x_ghost = self.decoder(f_ghost) # note that this only applies the decoder weight matrix, no bias
+            x_ghost = f_ghost @ self.decoder.weight.index_select(1, ghost_idxs).T # note that this only applies the decoder weight matrix, no bias
             x_hat = self.decode(f)
             if output_features:
                 return x_hat, x_ghost, f
             else:
                 return x_hat, x_ghost
+
+    @classmethod
+    def from_pretrained(cls, path, device=None):
+        """
+        Load a pretrained autoencoder from a file containing its state_dict.
+        The file is memory-mapped and its tensors become the parameters directly, so no weights
+        are initialized or copied on the CPU.
+        """
+        state_dict = t.load(path, map_location='cpu', mmap=True, weights_only=True)
+        dict_size, activation_dim = state_dict['encoder.weight'].shape
+        with t.device('meta'): # skip allocating and initializing weights that would be overwritten
+            autoencoder = cls(activation_dim, dict_size)
+        autoencoder.load_state_dict(state_dict, assign=True)
+        if device is not None:
+            autoencoder.to(device)
+        return autoencoder
             
 class IdentityDict(Dictionary, nn.Module):
     """
@@ -150,20 +150,22 @@ def evaluate(
                 "Not enough activations in buffer. Pass a buffer with a smaller batch size or more data."
             )
 
+        # run the dictionary once and reuse the reconstruction and features below
+        x_hat, features = dictionary(acts, output_features=True)
+
         # compute reconstruction (L2) loss and sparsity loss
         mse_loss, sparsity_loss = sae_loss(
-            acts, dictionary, sparsity_penalty=None, use_entropy=entropy, separate=True
+            acts, dictionary, sparsity_penalty=None, use_entropy=entropy, separate=True, outputs=(x_hat, features)
         )
         out["mse_loss"] = mse_loss.item() ** 2  # / acts.norm(dim=-1).mean().item() ** 2
         out["sparsity_loss"] = sparsity_loss.item()
 
         # compute variance explained
         total_variance = t.var(acts, dim=0).sum()
-        residual_variance = t.var(acts - dictionary(acts), dim=0).sum()
+        residual_variance = t.var(acts - x_hat, dim=0).sum()
         out["variance_explained"] = (1 - residual_variance / total_variance).item()
 
         # compute mean L0 norm and percentage of neurons alive
-        features = dictionary.encode(acts)
         actives = features != 0
         out["l0"] = actives.float().sum(dim=-1).mean().item()
         alives = actives.any(dim=0)
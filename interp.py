@@ -1,6 +1,5 @@
 import random
 from circuitsvis.activations import text_neuron_activations
-from einops import rearrange
 import torch as t
 from collections import namedtuple
 import umap
@@ -97,18 +96,20 @@ def examine_dimension(model, submodule, buffer, dictionary=None, max_length=128,
 
     # get top k tokens by mean activation
     tokens = tokens.value
-    token_mean_acts = {}
-    for ctx in tokens:
-        for tok in ctx:
-            if tok.item() in token_mean_acts:
-                continue
-            idxs = (tokens == tok).nonzero(as_tuple=True)
-            token_mean_acts[tok.item()] = activations[idxs].mean().item()
-    top_tokens = sorted(token_mean_acts.items(), key=lambda x: x[1], reverse=True)[:k]
-    top_tokens = [(model.tokenizer.decode(tok), act) for tok, act in top_tokens]
+    unique_tokens, inverse = t.unique(tokens, return_inverse=True)
+    inverse = inverse.flatten().to(activations.device)
+    # accumulate in fp32 so that sums over common tokens stay accurate for fp16/bf16 activations
+    act_sums = t.zeros(len(unique_tokens), dtype=t.float32, device=activations.device)
+    act_sums.scatter_add_(0, inverse, activations.flatten().float())
+    token_counts = t.bincount(inverse, minlength=len(unique_tokens))
+    token_mean_acts = act_sums / token_counts
+    top_means, top_idxs = t.topk(token_mean_acts, k=min(k, len(unique_tokens)))
+    top_tokens = [
+        (model.tokenizer.decode(tok), act) for tok, act in zip(unique_tokens[top_idxs.to(unique_tokens.device)].tolist(), top_means.tolist())
+    ]
 
-    flattened_acts = rearrange(activations, 'b n -> (b n)')
-    topk_indices = t.argsort(flattened_acts, dim=0, descending=True)[:k]
+    flattened_acts = activations.flatten()
+    topk_indices = t.topk(flattened_acts, k=min(k, flattened_acts.shape[0]), dim=0).indices
     batch_indices = topk_indices // activations.shape[1]
     token_indices = topk_indices % activations.shape[1]
     tokens = [
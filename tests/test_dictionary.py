@@ -0,0 +1,30 @@
+"""
+Tests for dictionary classes.
+Run from the directory containing dictionary_learning, e.g. `pytest dictionary_learning/tests`.
+"""
+
+import torch as t
+
+from dictionary_learning.dictionary import AutoEncoder
+
+
+def test_encode_under_bf16_autocast_matches_fp32_for_large_mean_inputs():
+    t.manual_seed(0)
+    activation_dim, dict_size = 64, 256
+    ae = AutoEncoder(activation_dim, dict_size)
+    # residual-stream-like activations: a large shared mean plus a small per-token part
+    mean = 100 * t.randn(activation_dim)
+    with t.no_grad():
+        ae.bias.copy_(mean)
+    x = mean + t.randn(32, activation_dim)
+
+    with t.no_grad():
+        pre_fp32 = ae.encoder(x - ae.bias)
+        with t.autocast(device_type='cpu', dtype=t.bfloat16):
+            pre_bf16 = ae.encoder(x - ae.bias)
+            f_bf16 = ae.encode(x)
+
+    # the error should be bf16 rounding relative to the centered pre-activations, not to the uncentered input
+    tol = 0.02 * pre_fp32.abs().max()
+    assert (pre_bf16.float() - pre_fp32).abs().max() < tol
+    assert (f_bf16.float() - t.relu(pre_fp32)).abs().max() < tol
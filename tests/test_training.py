@@ -0,0 +1,101 @@
+"""
+Tests for training utilities.
+Run from the directory containing dictionary_learning, e.g. `pytest dictionary_learning/tests`.
+"""
+
+import torch as t
+
+from dictionary_learning import training
+from dictionary_learning.dictionary import AutoEncoder
+from dictionary_learning.training import ConstrainedAdam, resample_neurons, trainSAE
+
+
+def _trained_ae_and_optimizer(activation_dim, dict_size):
+    # take one optimizer step so that Adam has state to reset
+    ae = AutoEncoder(activation_dim, dict_size)
+    optimizer = ConstrainedAdam(ae.parameters(), ae.decoder.parameters(), lr=1e-3)
+    ae(t.randn(8, activation_dim)).pow(2).sum().backward()
+    optimizer.step()
+    return ae, optimizer
+
+
+def _snapshot(ae, optimizer):
+    state = optimizer.state_dict()['state']
+    return {
+        'enc_w': ae.encoder.weight.detach().clone(),
+        'enc_b': ae.encoder.bias.detach().clone(),
+        'dec_w': ae.decoder.weight.detach().clone(),
+        'enc_w_avg': state[1]['exp_avg'].clone(),
+        'enc_b_avg': state[2]['exp_avg'].clone(),
+    }
+
+
+def test_resample_neurons_rewrites_dead_and_keeps_alive():
+    t.manual_seed(0)
+    ae, optimizer = _trained_ae_and_optimizer(4, 8)
+    before = _snapshot(ae, optimizer)
+    deads = t.zeros(8, dtype=t.bool)
+    deads[[1, 5]] = True
+
+    resample_neurons(deads, t.randn(16, 4), ae, optimizer)
+    state = optimizer.state_dict()['state']
+
+    # dead neurons get new encoder rows and decoder columns, zero encoder bias and zero Adam state
+    assert not t.allclose(ae.encoder.weight[deads], before['enc_w'][deads])
+    assert not t.allclose(ae.decoder.weight[:, deads], before['dec_w'][:, deads])
+    assert t.allclose(ae.decoder.weight[:, deads].norm(dim=0), t.ones(2))
+    assert (ae.encoder.bias[deads] == 0).all()
+    assert (state[1]['exp_avg'][deads] == 0).all()
+    assert (state[2]['exp_avg'][deads] == 0).all()
+
+    # live neurons are untouched
+    assert t.equal(ae.encoder.weight[~deads], before['enc_w'][~deads])
+    assert t.equal(ae.decoder.weight[:, ~deads], before['dec_w'][:, ~deads])
+    assert t.equal(ae.encoder.bias[~deads], before['enc_b'][~deads])
+    assert t.equal(state[1]['exp_avg'][~deads], before['enc_w_avg'][~deads])
+    assert t.equal(state[2]['exp_avg'][~deads], before['enc_b_avg'][~deads])
+
+
+def test_resample_neurons_limited_by_number_of_activations():
+    t.manual_seed(0)
+    ae, optimizer = _trained_ae_and_optimizer(4, 8)
+    before = _snapshot(ae, optimizer)
+    deads = t.zeros(8, dtype=t.bool)
+    deads[[0, 2, 3, 6]] = True
+    resampled, skipped = [0, 2], [3, 6]
+
+    resample_neurons(deads, t.randn(2, 4), ae, optimizer)
+    state = optimizer.state_dict()['state']
+
+    assert not t.allclose(ae.encoder.weight[resampled], before['enc_w'][resampled])
+    assert (state[1]['exp_avg'][resampled] == 0).all()
+
+    # dead neurons beyond the number of activation vectors keep their weights and Adam state
+    assert t.equal(ae.encoder.weight[skipped], before['enc_w'][skipped])
+    assert t.equal(ae.decoder.weight[:, skipped], before['dec_w'][:, skipped])
+    assert t.equal(state[1]['exp_avg'][skipped], before['enc_w_avg'][skipped])
+    assert t.equal(state[2]['exp_avg'][skipped], before['enc_b_avg'][skipped])
+
+
+def test_logging_does_not_advance_dead_neuron_counter(monkeypatch):
+    t.manual_seed(0)
+    activation_dim, dict_size, n_steps = 4, 64, 5
+
+    # trainSAE doesn't return its counter, so grab it from the first (training) call to sae_loss
+    counters = []
+    original_sae_loss = training.sae_loss
+    def recording_sae_loss(*args, **kwargs):
+        counters.append(kwargs['num_samples_since_activated'])
+        return original_sae_loss(*args, **kwargs)
+    monkeypatch.setattr(training, 'sae_loss', recording_sae_loss)
+
+    # with constant inputs and lr=0 the encoder never changes, so each neuron either fires every step or never
+    activations = [t.zeros(8, activation_dim) for _ in range(n_steps)]
+    ae = trainSAE(activations, activation_dim, dict_size, lr=0., sparsity_penalty=1e-3, log_steps=2)
+    counter = counters[0]
+
+    never_fired = (ae.encode(t.zeros(1, activation_dim))[0] == 0)
+    assert never_fired.any() and (~never_fired).any()
+    # logging happens on steps 0, 2 and 4 but must not count as extra steps
+    assert (counter[never_fired] == n_steps).all()
+    assert (counter[~never_fired] == 0).all()
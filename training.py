@@ -20,14 +20,14 @@ class ConstrainedAdam(t.optim.Adam):
     def step(self, closure=None):
         with t.no_grad():
             for p in self.constrained_params:
-                normed_p = p / p.norm(dim=0, keepdim=True)
+                normed_p = p / t.linalg.vector_norm(p, dim=0, keepdim=True).add_(EPS)
                 # project away the parallel component of the gradient
                 p.grad -= (p.grad * normed_p).sum(dim=0, keepdim=True) * normed_p
         super().step(closure=closure)
         with t.no_grad():
             for p in self.constrained_params:
                 # renormalize the constrained parameters
-                p /= p.norm(dim=0, keepdim=True)
+                p.div_(t.linalg.vector_norm(p, dim=0, keepdim=True).add_(EPS))
 
 def entropy(p, eps=1e-8):
     p_sum = p.sum(dim=-1, keepdim=True)
@@ -42,13 +42,17 @@ def entropy(p, eps=1e-8):
     return ent.sum(dim=-1).mean()
 
 
-def sae_loss(activations, ae, sparsity_penalty, use_entropy=False, separate=False, num_samples_since_activated=None, ghost_threshold=None):
+def sae_loss(activations, ae, sparsity_penalty, use_entropy=False, separate=False, num_samples_since_activated=None, ghost_threshold=None, outputs=None):
     """
     Compute the loss of an autoencoder on some activations
     If separate is True, return the MSE loss, the sparsity loss, and the ghost loss separately
     If num_samples_since_activated is not None, update it in place
     If ghost_threshold is not None, use it to do ghost grads
+    If outputs is not None, it should be the (x_hat, f) that ae already computed on activations; ae is then not rerun
     """
+    if outputs is not None and ghost_threshold is not None:
+        raise ValueError("precomputed outputs cannot be used with ghost grads")
+
     if isinstance(activations, tuple): # for cases when the input to the autoencoder is not the same as the output
         in_acts, out_acts = activations
     else: # typically the input to the autoencoder is the same as the output
@@ -65,25 +69,23 @@ def sae_loss(activations, ae, sparsity_penalty, use_entropy=False, separate=Fals
             ghost_loss = None
 
     if not ghost_grads: # if we're not doing ghost grads
-        x_hat, f = ae(in_acts, output_features=True)
+        if outputs is None:
+            x_hat, f = ae(in_acts, output_features=True)
+        else:
+            x_hat, f = outputs
         mse_loss = t.linalg.norm(out_acts - x_hat, dim=-1).mean()
     
     else: # if we're doing ghost grads        
         x_hat, x_ghost, f = ae(in_acts, output_features=True, ghost_mask=ghost_mask)
         residual = out_acts - x_hat
-        mse_loss = t.linalg.norm(residual, dim=-1).mean()
-        x_ghost = x_ghost * residual.norm(dim=-1, keepdim=True).detach() / (2 * x_ghost.norm(dim=-1, keepdim=True).detach() + EPS)
+        residual_norm = t.linalg.norm(residual, dim=-1, keepdim=True) # reused for rescaling x_ghost below
+        mse_loss = residual_norm.mean()
+        x_ghost = x_ghost * residual_norm.detach() / (2 * x_ghost.norm(dim=-1, keepdim=True).detach() + EPS)
         ghost_loss = t.linalg.norm(residual.detach() - x_ghost, dim=-1).mean()
 
     if num_samples_since_activated is not None: # update the number of samples since each neuron was last activated
-        deads = (f == 0).all(dim=0)
-        num_samples_since_activated.copy_(
-            t.where(
-                deads,
-                num_samples_since_activated + 1,
-                0
-            )
-        )
+        fired = (f != 0).any(dim=0)
+        num_samples_since_activated.add_(1).masked_fill_(fired, 0)
     
     if use_entropy:
         sparsity_loss = entropy(f)
@@ -110,6 +112,7 @@ def resample_neurons(deads, activations, ae, optimizer):
     Reinitialize all dead encoder vectors to be the mean alive encoder vector x 0.2.
     Reset the bias vectors for dead neurons to 0.
     Reset the Adam parameters for the dead neurons to their default values.
+    If there are more dead neurons than activation vectors, only the first ones are resampled.
     """
     with t.no_grad():
         if deads.sum() == 0:
@@ -125,24 +128,26 @@ def resample_neurons(deads, activations, ae, optimizer):
         losses = (out_acts - ae(in_acts)).norm(dim=-1)
 
         # sample inputs to create encoder/decoder weights from
-        n_resample = min([deads.sum(), losses.shape[0]])
+        n_resample = min(deads.sum().item(), losses.shape[0])
         indices = t.multinomial(losses, num_samples=n_resample, replacement=False)
         sampled_vecs = out_acts[indices]
 
+        # write into the parameters in place; chained boolean indexing would only modify a copy
+        resample_idxs = deads.nonzero().squeeze(1)[:n_resample]
         alive_norm = ae.encoder.weight[~deads].norm(dim=-1).mean()
-        ae.encoder.weight[deads][:n_resample] = sampled_vecs * alive_norm * 0.2
-        ae.decoder.weight[:,deads][:,:n_resample] = (sampled_vecs / sampled_vecs.norm(dim=-1, keepdim=True)).T
+        ae.encoder.weight.index_copy_(0, resample_idxs, sampled_vecs * alive_norm * 0.2)
+        ae.decoder.weight.index_copy_(1, resample_idxs, (sampled_vecs / sampled_vecs.norm(dim=-1, keepdim=True)).T)
         # reset bias vectors for dead neurons
-        ae.encoder.bias[deads][:n_resample] = 0.
+        ae.encoder.bias.index_fill_(0, resample_idxs, 0.)
 
-        # reset Adam parameters for dead neurons
+        # reset Adam parameters for the resampled neurons
         state_dict = optimizer.state_dict()['state']
         # # encoder weight
-        state_dict[1]['exp_avg'][deads] = 0.
-        state_dict[1]['exp_avg_sq'][deads] = 0.
+        state_dict[1]['exp_avg'][resample_idxs] = 0.
+        state_dict[1]['exp_avg_sq'][resample_idxs] = 0.
         # # encoder bias
-        state_dict[2]['exp_avg'][deads] = 0.
-        state_dict[2]['exp_avg_sq'][deads] = 0.
+        state_dict[2]['exp_avg'][resample_idxs] = 0.
+        state_dict[2]['exp_avg_sq'][resample_idxs] = 0.
 
 
 def trainSAE(
@@ -159,12 +164,19 @@ def trainSAE(
         save_steps=None, # how often to save checkpoints
         save_dir=None, # directory for saving checkpoints
         log_steps=1000, # how often to print statistics
+        compile_ae=False, # whether to torch.compile the autoencoder's forward pass
+        autocast_dtype=None, # if t.bfloat16, compute the training loss under bf16 autocast
         device='cpu'):
     """
     Train and return a sparse autoencoder
     """
+    # fp16 would need loss scaling to avoid gradient under/overflow; bf16 has fp32's exponent range and doesn't
+    if autocast_dtype not in (None, t.bfloat16):
+        raise ValueError(f"autocast_dtype must be None or torch.bfloat16, got {autocast_dtype}")
     ae = AutoEncoder(activation_dim, dictionary_size).to(device)
-    num_samples_since_activated = t.zeros(dictionary_size, dtype=int).to(device) # how many samples since each neuron was last activated?
+    # the compiled module shares its parameters with ae; ae itself is what gets saved and returned
+    ae_forward = t.compile(ae) if compile_ae else ae
+    num_samples_since_activated = t.zeros(dictionary_size, dtype=t.int32, device=device) # how many samples since each neuron was last activated?
 
     # set up optimizer and scheduler
     optimizer = ConstrainedAdam(ae.parameters(), ae.decoder.parameters(), lr=lr)
@@ -180,14 +192,18 @@ def trainSAE(
         if steps is not None and step >= steps:
             break
 
+        # only copies out of pinned memory may be asynchronous; in particular a non-blocking GPU-to-CPU copy
+        # could be read before it has finished
         if isinstance(acts, t.Tensor): # typical casse
-            acts = acts.to(device)
+            acts = acts.to(device, non_blocking=acts.is_pinned())
         elif isinstance(acts, tuple): # for cases where the autoencoder input and output are different
-            acts = tuple(a.to(device) for a in acts)
+            acts = tuple(a.to(device, non_blocking=a.is_pinned()) for a in acts)
 
         optimizer.zero_grad()
         # computing the sae_loss also updates num_samples_since_activated in place
-        loss = sae_loss(acts, ae, sparsity_penalty, use_entropy=entropy, num_samples_since_activated=num_samples_since_activated, ghost_threshold=ghost_threshold)
+        # parameters and optimizer state stay in fp32; autocast only lowers the precision of the forward matmuls
+        with t.autocast(device_type=t.device(device).type, dtype=autocast_dtype, enabled=autocast_dtype is not None):
+            loss = sae_loss(acts, ae_forward, sparsity_penalty, use_entropy=entropy, num_samples_since_activated=num_samples_since_activated, ghost_threshold=ghost_threshold)
         loss.backward()
         optimizer.step()
         scheduler.step()
@@ -200,7 +216,8 @@ def trainSAE(
         # logging
         if log_steps is not None and step % log_steps == 0:
             with t.no_grad():
-                losses = sae_loss(acts, ae, sparsity_penalty, entropy, separate=True, num_samples_since_activated=num_samples_since_activated, ghost_threshold=ghost_threshold)
+                # pass a copy so that logging doesn't advance the dead-neuron bookkeeping a second time this step
+                losses = sae_loss(acts, ae, sparsity_penalty, entropy, separate=True, num_samples_since_activated=num_samples_since_activated.clone(), ghost_threshold=ghost_threshold)
                 if ghost_threshold is None:
                     mse_loss, sparsity_loss = losses
                     print(f"step {step} MSE loss: {mse_loss}, sparsity loss: {sparsity_loss}")